@@ -14,8 +14,6 @@
 #include "utils.h"
 #include "cursor.h"
 
-#define CDATA(L) pgm_read_byte(&trie->completions[L])
-
 //////////////////////////////////////////////////////////////////
 bool cursor_advance_to_valid_output(st_cursor_t *cursor)
 {
@@ -96,10 +94,14 @@ uint16_t st_cursor_get_keycode(st_cursor_t *cursor)
     }
     // This is an output cursor focused on rule matching keypress
     // get the character at the sub_indax of the transform completion
+    // Continue decoding from the last char read from this completion,
+    // so reading a compressed completion char by char stays cheap.
     const st_trie_payload_t *action = st_cursor_get_action(cursor);
-    int completion_char_index = action->completion_index;
-    completion_char_index += action->completion_len - 1 - cursor->cursor_pos.sub_index;
-    return st_char_to_keycode(CDATA(completion_char_index));
+    const int completion_char_index = action->completion_len - 1 - cursor->cursor_pos.sub_index;
+    return st_char_to_keycode(st_completion_char_from(trie,
+                                                      &cursor->cached_code_index,
+                                                      &cursor->cached_code_char,
+                                                      completion_char_index));
 }
 //////////////////////////////////////////////////////////////////
 // DO NOT USE externally when cursor is initialized to act
@@ -123,6 +125,9 @@ st_trie_payload_t *st_cursor_get_action(st_cursor_t *cursor)
     } else {
         st_get_payload_from_match_index(cursor->trie, action, keyaction->action_taken);
     }
+    // Completion decoding restarts at the start of the new action
+    cursor->cached_code_index = action->completion_index;
+    cursor->cached_code_char = 0;
     cursor->cache_valid = true;
     return action;
 }
@@ -30,8 +30,12 @@ Examples:
 """
 
 import re
+import sys
 import textwrap
 import json
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, repeat
 from typing import Any, Dict, Iterator, List, Tuple, Callable
 from datetime import date, datetime
 from string import digits
@@ -60,9 +64,20 @@ MOD_LSFT = 0x0200
 KC_MAGIC_0 = 0x0100
 TRIE_MATCH_BIT = 0x8000
 TRIE_BRANCH_BIT = 0x4000
+TRIE_CODE_MASK = 0x3FFF
+TRIE_PACKED_CHAIN_MIN = 0x0400
 qmk_digits = digits[1:] + digits[0]
 OUTPUT_FUNC_1 = 1
 OUTPUT_FUNC_COUNT_MAX = 7
+RULE_INDEX_HASH_MULT = 31
+COMPLETION_BIGRAM_CODE_0 = 0x80
+COMPLETION_BIGRAMS_MAX = 128
+
+# Trace levels, each one includes the ones before it
+TRACE_OFF = 0
+TRACE_INFO = 1   # sizes of the generated tables
+TRACE_DEBUG = 2  # per rule and per completion details
+TRACE_DUMP = 3   # full trie dumps
 
 max_backspaces = 0
 S = lambda code: MOD_LSFT | code
@@ -99,6 +114,12 @@ def err(*text: Any) -> str:
     return red("Error:", *text)
 
 
+###############################################################################
+def line_location(rule_set_name: str, line_number: int) -> str:
+    """Names a rules file line like the tester does: "[rule set] line N"."""
+    return f'{rule_set_name} line {line_number}' if rule_set_name else f'line {line_number}'
+
+
 ###############################################################################
 def map_range(start: int, chars: str) -> dict[str, int]:
     return {char: start + i for i, char in enumerate(chars)}
@@ -106,11 +127,13 @@ def map_range(start: int, chars: str) -> dict[str, int]:
 
 ###############################################################################
 def generate_context_char_map(magic_chars, wordbreak_char) -> Dict[str, int]:
+    # Each shifted range lines up with the unshifted keys above it,
+    # e.g. '\\' is KC_BSLS and '|' is S(KC_BSLS)
     return {
         **map_range(KC_SEMICOLON, ";'`,./"),
         **map_range(S(KC_SEMICOLON), ":\"~<>?"),
         **map_range(KC_MINUS, "-=[]\\"),
-        **map_range(S(KC_MINUS), "_+\{\}|"),
+        **map_range(S(KC_MINUS), "_+{}|"),
         **map_range(KC_1, qmk_digits),
         **map_range(S(KC_1), "!@#$%^&*()"),
         **map_range(KC_MAGIC_0, magic_chars),
@@ -121,11 +144,47 @@ def generate_context_char_map(magic_chars, wordbreak_char) -> Dict[str, int]:
 
 
 ###############################################################################
-def quiet_print(*args, **kwargs):
-    if IS_QUIET:
+def generate_ascii_keycode_map() -> Dict[str, int]:
+    """Maps ascii chars to keycodes the same way st_char_to_keycode() does:
+    the context chars, with no magic chars and space as the word break,
+    plus the uppercase letters.
+    """
+    return {
+        **generate_context_char_map('', ' '),
+        **{chr(c): S(c + KC_A - ord('A')) for c in range(ord('A'), ord('Z') + 1)}
+    }
+
+
+###############################################################################
+def tracing(level: int) -> bool:
+    """Tells if traces at `level` are written. Loops check it once,
+    rather than making a trace() lambda for every item.
+    """
+    return level <= TRACE_LEVEL
+
+
+###############################################################################
+def trace(level: int, message: Callable[[], Any]):
+    """Writes message() to the trace file when tracing at `level`.
+    The message is only built when it will be written, so callers
+    pass a lambda and pay nothing for it when tracing is off.
+    """
+    if not tracing(level):
+        return
+
+    print(message(), file=TRACE_FILE)
+
+
+###############################################################################
+def trace_json(level: int, obj: Any):
+    """Streams obj to the trace file as indented json when tracing at `level`,
+    without building the whole json string in memory first.
+    """
+    if not tracing(level):
         return
 
-    print(*args, **kwargs)
+    json.dump(obj, TRACE_FILE, indent=4)
+    print(file=TRACE_FILE)
 
 
 ###############################################################################
@@ -144,61 +203,107 @@ def generate_output_func_char_map(output_func_chars) -> Dict[str, int]:
     ])
 
 
+###############################################################################
+class KeycodeStore:
+    """Keycodes of every rule's context, encoded once by parse_file.
+    Contexts are stored back to back in one uint16 array,
+    so rule i's keycodes are keycodes[offsets[i]:offsets[i + 1]].
+    Chars missing from the char map are stored as 0 (KC_NO).
+    """
+
+    def __init__(self, contexts: List[str], char_map: Dict[str, int]):
+        self.offsets = array('L', accumulate(map(len, contexts), initial=0))
+        self.keycodes = array(
+            'H', map(char_map.get, ''.join(contexts), repeat(0))
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, rule: int) -> array:
+        return self.keycodes[self.offsets[rule]:self.offsets[rule + 1]]
+
+    def rule_len(self, rule: int) -> int:
+        return self.offsets[rule + 1] - self.offsets[rule]
+
+    def invalid_rules(self) -> List[int]:
+        """Returns the rules whose context has chars missing from the char map."""
+        if 0 not in self.keycodes:
+            return []
+
+        return sorted({
+            bisect_right(self.offsets, i) - 1
+            for i, code in enumerate(self.keycodes) if not code
+        })
+
+
 ###############################################################################
 def parse_file(
     file_name: str, char_map: Dict[str, int],
-    separator: str, comment: str
-) -> List[Tuple[str, str]]:
+    separator: str, comment: str, rule_set_name: str = ''
+) -> Tuple[List[Tuple[str, str, int]], KeycodeStore]:
     """Parses sequence dictionary file.
     Each line of the file defines one "sequence -> transformation" pair.
     Blank lines or lines starting with the comment string are ignored.
     The function validates that sequences only have characters a-z.
     Overlapping sequences are matched to the longest valid match.
+    Each rule keeps the line number it came from, for error reporting.
+    Every error in the file is reported at once,
+    with the rule set name when there are several.
+
+    Returns:
+    the rules, and the keycodes of their contexts, in the same order.
     """
 
-    file_lines = parse_file_lines(file_name, separator, comment)
+    file_lines = parse_file_lines(file_name, separator, comment, rule_set_name)
+    rules = [
+        (context, completion, line_number)
+        for line_number, context, completion in file_lines
+    ]
+    rule_keycodes = KeycodeStore([context for context, _, _ in rules], char_map)
     context_set = set()
-    duplicated_rules = []
-    rules = []
+    errors = []
 
-    for line_number, context, completion in file_lines:
+    for context, _, line_number in rules:
         if context in context_set:
-            duplicated_rules.append(
-                f'{err("line", line_number)}: '
+            errors.append((line_number,
+                f'{err(line_location(rule_set_name, line_number))}: '
                 f'Duplicate sequence: "{cyan(context)}"'
-            )
+            ))
 
-        # Check that `context` is valid.
-        if not all([(c in char_map) for c in context[:-1]]):
-            raise SystemExit(
-                f'{err("line", line_number)}: '
-                f'sequence "{cyan(context)}" has invalid characters'
-            )
+        context_set.add(context)
 
-        if len(context) > 127:
-            raise SystemExit(
-                f'{err("line", line_number)}:'
-                f'Sequence exceeds 127 chars: "{cyan(context)}"'
-            )
+    for rule in rule_keycodes.invalid_rules():
+        context, _, line_number = rules[rule]
+        errors.append((line_number,
+            f'{err(line_location(rule_set_name, line_number))}: '
+            f'sequence "{cyan(context)}" has invalid characters'
+        ))
 
-        rules.append((context, completion))
-        context_set.add(context)
+    for rule, (context, _, line_number) in enumerate(rules):
+        if rule_keycodes.rule_len(rule) > 127:
+            errors.append((line_number,
+                f'{err(line_location(rule_set_name, line_number))}:'
+                f'Sequence exceeds 127 chars: "{cyan(context)}"'
+            ))
 
-    if duplicated_rules:
-        raise SystemExit("\n".join(duplicated_rules))
+    if errors:
+        errors.sort(key=lambda error: error[0])
+        raise SystemExit("\n".join(error for _, error in errors))
 
-    return rules
+    return rules, rule_keycodes
 
 
 ###############################################################################
 def make_trie(
-    seq_dict: List[Tuple[str, str]],
+    seq_dict: List[Tuple[str, str, int]],
+    rule_keycodes: KeycodeStore,
     output_func_char_map: Dict[str, int]
-) -> Dict[str, tuple[str, dict]]:
-    """Makes a trie from the sequences, writing in reverse."""
+) -> Dict[Any, tuple[str, dict]]:
+    """Makes a trie keyed by keycode from the sequences, writing in reverse."""
     trie = {}
 
-    for context, correction in seq_dict:
+    for rule, (context, correction, _) in enumerate(seq_dict):
         node = trie
 
         if correction[-1] in output_func_char_map:
@@ -209,10 +314,11 @@ def make_trie(
             output_func = 0
             target = correction
 
-        for letter in context[::-1]:
-            node = node.setdefault(letter, {})
+        for code in reversed(rule_keycodes[rule]):
+            node = node.setdefault(code, {})
 
         node['MATCH'] = (context, {
+            'RULE': rule,
             'TARGET': target,
             'RESULT': {
                 'BACKSPACES': -1,
@@ -225,7 +331,24 @@ def make_trie(
 
 
 ###############################################################################
-def complete_trie(trie: Dict[str, Any], wordbreak_char: str) -> set[str]:
+def char_keyed_trie(
+    trie: Dict[Any, Any], keycode_chars: Dict[int, str]
+) -> Dict[str, Any]:
+    """Copies a keycode keyed trie with its keys mapped back to rule chars,
+    so trie dumps can be read against the rules file."""
+    return {
+        keycode_chars.get(key, key): (
+            node if key == 'MATCH' else char_keyed_trie(node, keycode_chars)
+        )
+        for key, node in trie.items()
+    }
+
+
+###############################################################################
+def complete_trie(
+    trie: Dict[Any, Any], wordbreak_char: str,
+    rule_keycodes: KeycodeStore, char_map: Dict[str, int]
+) -> set[str]:
     outputs = set()
 
     def complete_node(context, completion):
@@ -233,22 +356,28 @@ def complete_trie(trie: Dict[str, Any], wordbreak_char: str) -> set[str]:
 
         back_context = []
         expanded_context = []
+        # Keycodes of expanded_context, used to search the trie
+        expanded_keycodes = []
+        keycodes = rule_keycodes[completion['RULE']]
 
-        for c in context[:-1]:
-            back_context.append(c)
+        for c, code in zip(context[:-1], keycodes):
+            back_context.append(code)
             expanded_context.append(c)
+            expanded_keycodes.append(code)
             match = get_trie_result(back_context)
 
             if not match:
-                match = get_trie_result(expanded_context)
+                match = get_trie_result(expanded_keycodes)
 
             if match:
                 match_backspaces = match['RESULT']['BACKSPACES']
                 match_output = match['RESULT']['OUTPUT']
 
                 del expanded_context[-(match_backspaces + 1):]
+                del expanded_keycodes[-(match_backspaces + 1):]
                 expanded_context.extend(match_output)
-                # quiet_print(c, expanded_context)
+                expanded_keycodes.extend(map(char_map.get, match_output))
+                # trace(TRACE_DUMP, lambda: (c, expanded_context))
 
         if expanded_context and expanded_context[0] == wordbreak_char:
             del expanded_context[0]
@@ -269,7 +398,7 @@ def complete_trie(trie: Dict[str, Any], wordbreak_char: str) -> set[str]:
         completion['RESULT']['BACKSPACES'] = backspaces
         completion['RESULT']['OUTPUT'] = output
 
-    def get_trie_result(buffer: List[str]) -> dict[str, dict[str]]:
+    def get_trie_result(buffer: List[int]) -> dict[str, dict[str]]:
         longest_match = {}
         trienode = trie
 
@@ -277,7 +406,7 @@ def complete_trie(trie: Dict[str, Any], wordbreak_char: str) -> set[str]:
             if c not in trienode:
                 break
 
-            # quiet_print(c)
+            # trace(TRACE_DUMP, lambda: c)
             trienode = trienode[c]
 
             if 'MATCH' in trienode:
@@ -350,7 +479,7 @@ def parse_tokens(tokens: List[str], parse_regex: bool) -> Iterator[Tuple[int, st
 
 ###############################################################################
 def parse_file_lines(
-    file_name: str, separator: str, comment: str
+    file_name: str, separator: str, comment: str, rule_set_name: str = ''
 ) -> Iterator[Tuple[int, str, str]]:
     """Parses lines read from `file_name` into context-correction pairs."""
     with open(file_name, 'rt', encoding="utf-8") as file:
@@ -381,19 +510,98 @@ def parse_file_lines(
 
             if len(tokens) != 2 or not tokens[0]:
                 raise SystemExit(
-                    f'{err(line_number)}: Invalid syntax: "{red(line)}"'
+                    f'{err(line_location(rule_set_name, line_number))}: Invalid syntax: "{red(line)}"'
                 )
 
             for context, correction in parse_tokens(tokens, in_regex_zone):
                 yield line_number, context, correction
 
 
+###############################################################################
+def substitute_bigram(tokens: List[int], bigram: str, code: int) -> List[int]:
+    """Replaces every non-overlapping pair of literal chars matching
+    `bigram` in an encoded completion with `code`.
+    """
+    first, second = map(ord, bigram)
+    result = []
+    i = 0
+
+    while i < len(tokens):
+        if tokens[i] == first and tokens[i + 1:i + 2] == [second]:
+            result.append(code)
+            i += 2
+
+        else:
+            result.append(tokens[i])
+            i += 1
+
+    return result
+
+
+###############################################################################
+def choose_completion_bigrams(outputs: set[str]) -> List[str]:
+    """Greedily picks the pairs of chars that save the most bytes
+    when replaced by a single code in the completion strings.
+    Completions found inside longer ones aren't stored, so they aren't counted.
+    """
+    stored_outputs = []
+
+    for output in sorted(outputs, key=len, reverse=True):
+        if not any(output in stored for stored in stored_outputs):
+            stored_outputs.append(output)
+
+    encoded = [[ord(c) for c in output] for output in stored_outputs]
+    bigrams = []
+
+    while len(bigrams) < COMPLETION_BIGRAMS_MAX:
+        counts = {}
+
+        for tokens in encoded:
+            for pair in zip(tokens, tokens[1:]):
+                if max(pair) < COMPLETION_BIGRAM_CODE_0:
+                    counts[pair] = counts.get(pair, 0) + 1
+
+        if not counts:
+            break
+
+        pair, count = max(counts.items(), key=lambda item: (item[1], item[0]))
+
+        # Each substitution saves a byte, but the table entry costs 2
+        if count <= 2:
+            break
+
+        bigram = ''.join(map(chr, pair))
+        code = COMPLETION_BIGRAM_CODE_0 + len(bigrams)
+        encoded = [substitute_bigram(tokens, bigram, code) for tokens in encoded]
+        bigrams.append(bigram)
+
+    return bigrams
+
+
+###############################################################################
+def encode_completion(output: str, bigrams: List[str]) -> bytes:
+    """Encodes a completion string, replacing pairs of chars by their code
+    in the bigram table, in the order the bigrams were chosen.
+    """
+    tokens = list(bytes(output, 'ascii'))
+
+    for i, bigram in enumerate(bigrams):
+        tokens = substitute_bigram(tokens, bigram, COMPLETION_BIGRAM_CODE_0 + i)
+
+    return bytes(tokens)
+
+
 ###############################################################################
 def serialize_outputs(
-    outputs: set[str]
+    outputs: set[str], bigrams: List[str]
 ) -> Tuple[List[int], Dict[str, int], int]:
-    quiet_print(sorted(outputs, key=len, reverse=True))
+    trace(TRACE_DEBUG, lambda: sorted(outputs, key=len, reverse=True))
+    trace_outputs = tracing(TRACE_DEBUG)
     completions_str = ''
+    completions_bytes = b''
+    # Offsets in completions_bytes of the chars that start an encoded byte.
+    # A completion can end in the middle of a bigram, but not start there.
+    byte_offsets = {}
     completions_map = {}
     completions_offset = 0
     max_completion_len = 0
@@ -402,20 +610,32 @@ def serialize_outputs(
         max_completion_len = max(max_completion_len, len(output))
         i = completions_str.find(output)
 
+        while i != -1 and i not in byte_offsets:
+            i = completions_str.find(output, i + 1)
+
         if i == -1:
-            quiet_print(f'{output} added at {completions_offset}')
+            if trace_outputs:
+                trace(TRACE_DEBUG, lambda: f'{output} added at {completions_offset}')
+
             completions_map[output] = completions_offset
-            completions_str += output
-            completions_offset += len(output)
+
+            for code in encode_completion(output, bigrams):
+                byte_offsets[len(completions_str)] = completions_offset
+                completions_str += bigrams[code - COMPLETION_BIGRAM_CODE_0] \
+                    if code >= COMPLETION_BIGRAM_CODE_0 else chr(code)
+                completions_bytes += bytes([code])
+                completions_offset += 1
 
         else:
-            quiet_print(f'{output} found at {i}')
-            completions_map[output] = i
+            if trace_outputs:
+                trace(TRACE_DEBUG, lambda: f'{output} found at {byte_offsets[i]}')
+
+            completions_map[output] = byte_offsets[i]
 
-    quiet_print(completions_str)
+    trace(TRACE_DEBUG, lambda: completions_str)
 
     return (
-        list(bytes(completions_str, 'ascii')),
+        list(completions_bytes),
         completions_map,
         max_completion_len
     )
@@ -425,13 +645,18 @@ def serialize_outputs(
 def serialize_trie(
     char_map: Dict[str, int], trie: Dict[str, Any],
     completions_map: Dict[str, int]
-) -> List[int]:
+) -> Tuple[List[int], List[Dict[str, Any]]]:
     """Serializes trie in a form readable by the C code.
 
     Returns:
-    List of 16bit ints in the range 0-64k.
+    List of 16bit ints in the range 0-64k,
+    and the match table entries in the order the C rule search visits them.
     """
     table = []
+    match_entries = []
+    # Children are ordered by rule char, not keycode,
+    # which keeps the serialized layout (and rule search order) unchanged.
+    keycode_chars = {code: c for c, code in char_map.items()}
 
     # Traverse trie in depth first order.
     def traverse(trie_node):
@@ -463,27 +688,33 @@ def serialize_trie(
             # First output word stores coded info
             # Second stores completion data offset index
             data = [code, output_index]
-            # quiet_print(f'{err(0)} Data "{cyan(data)}"')
+            match = {
+                'sequence': sequence,
+                'output': output,
+                'backspaces': backspaces
+            }
+            # trace(TRACE_DUMP, lambda: f'{err(0)} Data "{cyan(data)}"')
             del trie_node['MATCH']
 
         else:
             data = []
+            match = None
 
         if len(trie_node) == 0:
             entry = {'data': data, 'links': [], 'uint16_offset': 0}
             table.append(entry)
 
         elif len(trie_node) == 1:  # Handle trie node with a single child.
-            c, trie_node = next(iter(trie_node.items()))
-            entry = {'data': data, 'chars': c, 'uint16_offset': 0}
+            code, trie_node = next(iter(trie_node.items()))
+            entry = {'data': data, 'keycodes': [code], 'uint16_offset': 0}
 
             # It's common for a trie to have long chains of single-child nodes.
 
             # We find the whole chain so that
             # we can serialize it more efficiently.
             while len(trie_node) == 1 and 'MATCH' not in trie_node:
-                c, trie_node = next(iter(trie_node.items()))
-                entry['chars'] += c
+                code, trie_node = next(iter(trie_node.items()))
+                entry['keycodes'].append(code)
 
             table.append(entry)
             entry['links'] = [traverse(trie_node)]
@@ -491,35 +722,45 @@ def serialize_trie(
         else:  # Handle trie node with multiple children.
             entry = {
                 'data': data,
-                'chars': ''.join(sorted(trie_node.keys())),
+                'keycodes': sorted(trie_node, key=keycode_chars.__getitem__),
                 'uint16_offset': 0
             }
 
             table.append(entry)
-            entry['links'] = [traverse(trie_node[c]) for c in entry['chars']]
+            entry['links'] = [traverse(trie_node[code]) for code in entry['keycodes']]
 
-        # quiet_print(f'{err(0)} Data "{cyan(entry["data"])}"')
+        # Children are searched before their parent's match
+        if match:
+            entry['match'] = match
+            match_entries.append(entry)
+
+        # trace(TRACE_DUMP, lambda: f'{err(0)} Data "{cyan(entry["data"])}"')
         return entry
 
     traverse(trie)
-    # quiet_print(f'{err(0)} Data "{cyan(table)}"')
+    # trace(TRACE_DUMP, lambda: f'{err(0)} Data "{cyan(table)}"')
 
     def serialize(node: Dict[str, Any]) -> List[int]:
         data = node['data']
-        # quiet_print(f'{err(0)} Serialize Data "{cyan(data)}"')
+        # trace(TRACE_DUMP, lambda: f'{err(0)} Serialize Data "{cyan(data)}"')
 
         if not node['links']:  # Handle a leaf table entry.
             return data
 
         elif len(node['links']) == 1:  # Handle a chain table entry.
-            return data + [char_map[c] for c in node['chars']] + [0]
+            chain = node['keycodes']
+
+            if PACKED_CHAINS:
+                return data + pack_chain(chain)
+
+            return data + chain + [0]
 
         else:  # Handle a branch table entry.
             links = []
 
-            for c, link in zip(node['chars'], node['links']):
+            for code, link in zip(node['keycodes'], node['links']):
                 links += [
-                    char_map[c] | (0 if links else TRIE_BRANCH_BIT)
+                    code | (0 if links else TRIE_BRANCH_BIT)
                 ] + encode_link(link)
 
             return data + links + [0]
@@ -534,7 +775,232 @@ def serialize_trie(
         assert 0 <= uint16_offset <= 0xffff
 
     # Serialize final table.
-    return [b for node in table for b in serialize(node)]
+    return [b for node in table for b in serialize(node)], match_entries
+
+
+###############################################################################
+def is_byte_keycode(code: int) -> bool:
+    """Keycodes that fit in the high byte of a chain word
+    without setting the node type bits.
+    """
+    return KC_A <= code < 0x40
+
+
+###############################################################################
+def pack_chain(chain: List[int]) -> List[int]:
+    """Packs chain keycodes two per word, the first one in the high byte.
+
+    Words below TRIE_PACKED_CHAIN_MIN hold a single (wide) keycode.
+    The chain ends after a zero low byte, or at a zero word.
+    """
+    words = []
+    i = 0
+
+    while i < len(chain):
+        code = chain[i]
+
+        if not is_byte_keycode(code):
+            words.append(code)
+            i += 1
+
+        elif i + 1 == len(chain):
+            return words + [code << 8]
+
+        elif is_byte_keycode(chain[i + 1]):
+            words.append(code << 8 | chain[i + 1])
+            i += 2
+
+        else:
+            words.append(code)
+            i += 1
+
+    return words + [0]
+
+
+###############################################################################
+def unpack_chain_word(code: int) -> List[int]:
+    """Returns the keycodes held by a (packed or plain) chain word."""
+    if code < TRIE_PACKED_CHAIN_MIN:
+        return [code]
+
+    return [code >> 8] + ([code & 0xff] if code & 0xff else [])
+
+
+###############################################################################
+def serialize_rule_index(
+    ascii_map: Dict[str, int], match_entries: List[Dict[str, Any]],
+    tail_len: int
+) -> List[int]:
+    """Serializes a hashed index of match nodes keyed by the last `tail_len`
+    chars of their completion string (or the whole string if shorter).
+
+    Lets the missed rule search in the C code only inspect the few rules
+    whose completion could end the current key buffer.
+    Candidates are sorted in the same order the trie search would find them:
+    longest completion first, then fewest backspaces, then descending trie
+    offset, since the search keeps the last matching sibling at skipped
+    levels and tries a node's children before the node itself.
+
+    Returns:
+    List of 16bit ints: [bucket mask, tail len, bucket starts..., offsets...]
+    """
+    def tail_hash(output: str) -> int:
+        # Most recent key first, like st_rule_index_hash()
+        code = 0
+
+        for c in reversed(output[-tail_len:]):
+            code = (code * RULE_INDEX_HASH_MULT + ascii_map.get(c, 0)) & 0xffff
+
+        return code
+
+    # Rules with no completion can't end the buffer, so they aren't indexed
+    candidates = sorted(
+        (entry for entry in match_entries if entry['match']['output']),
+        key=lambda entry: (
+            -len(entry['match']['output']), entry['match']['backspaces'],
+            -entry['uint16_offset']
+        )
+    )
+
+    tails = {entry['match']['output'][-tail_len:] for entry in candidates}
+    bucket_count = 1
+
+    while bucket_count < len(tails):
+        bucket_count *= 2
+
+    buckets = [[] for _ in range(bucket_count)]
+
+    for entry in candidates:
+        bucket = tail_hash(entry['match']['output']) & (bucket_count - 1)
+        buckets[bucket].append(entry['uint16_offset'])
+
+    bucket_starts = []
+    uint16_offset = 2 + bucket_count + 1
+
+    for bucket in buckets:
+        bucket_starts.append(uint16_offset)
+        uint16_offset += len(bucket)
+
+    bucket_starts.append(uint16_offset)
+    assert uint16_offset <= 0xffff
+
+    return [
+        bucket_count - 1, tail_len, *bucket_starts,
+        *[offset for bucket in buckets for offset in bucket]
+    ]
+
+
+###############################################################################
+def compute_lookup_reads(
+    char_map: Dict[str, int], trie_data: List[int]
+) -> Tuple[Tuple[int, str], Dict[int, int]]:
+    """Counts the trie data words st_find_longest_chain() reads per keypress.
+
+    Walks the serialized trie with the same chain layout and branch scan order
+    as the C code, for every way a search can end (mismatch in a chain,
+    key missing from a branch, or no child after a match).
+
+    Returns:
+    (worst case reads, sequence of the worst case path),
+    and a dict of match node offset -> reads needed to reach it.
+    """
+    keycode_chars = {code: c for c, code in char_map.items()}
+    worst_case = (0, '')
+    match_reads = {}
+
+    def path_str(path: List[int]) -> str:
+        return ''.join(keycode_chars.get(code, '?') for code in reversed(path))
+
+    def end_search(reads: int, path: List[int]):
+        nonlocal worst_case
+        if reads > worst_case[0]:
+            worst_case = (reads, path_str(path))
+
+    # Top of the st_find_longest_chain() loop
+    def search_node(offset: int, reads: int, path: List[int]):
+        start = offset
+        code = trie_data[offset]
+        reads += 1
+
+        if code & TRIE_BRANCH_BIT:
+            code &= TRIE_CODE_MASK
+            children = []
+
+            while code:
+                children.append((code, trie_data[offset + 1]))
+                offset += 2
+                code = trie_data[offset]
+
+            # find_branch_offset() reads every key code, then the final 0
+            end_search(reads + len(children), path)
+
+            # A matching key reads the key codes before it, then its link
+            for i, (key, child_offset) in enumerate(children):
+                search_traversed(child_offset, reads + i + 1, path + [key])
+
+        else:
+            chain_words = [unpack_chain_word(code)]
+
+            # A zero low byte ends a packed chain without a final 0 word
+            while code < TRIE_PACKED_CHAIN_MIN or code & 0xff:
+                offset += 1
+                code = trie_data[offset]
+
+                if not code:
+                    break
+
+                chain_words.append(unpack_chain_word(code))
+
+            chain = [key for keys in chain_words for key in keys]
+
+            # A mismatch on the last key reads every chain word before it
+            end_search(reads + len(chain_words) - 1, path + chain[:-1])
+
+            # A full match also reads the final 0 word, if there is one
+            search_traversed(offset + 1, reads + offset - start, path + chain)
+
+    # After traversing one or more keys, check if we are at a match
+    def search_traversed(offset: int, reads: int, path: List[int]):
+        code = trie_data[offset]
+        reads += 1
+
+        if not code & TRIE_MATCH_BIT:
+            # The same code is read again at the top of the loop
+            search_node(offset, reads, path)
+            return
+
+        match_reads[offset] = reads
+
+        if code & TRIE_BRANCH_BIT:
+            # The code of the child node is read before moving on
+            search_node(offset + 2, reads + 1, path)
+
+        else:
+            end_search(reads, path)
+
+    search_node(0, 0, [])
+    return worst_case, match_reads
+
+
+###############################################################################
+def lookup_reads_histogram(rule_reads: List[int]) -> List[str]:
+    """Returns comment lines with a histogram of the trie data reads
+    needed to reach each rule's match.
+    """
+    reads_count = {}
+
+    for reads in rule_reads:
+        reads_count[reads] = reads_count.get(reads, 0) + 1
+
+    max_count = max(reads_count.values(), default=0)
+    lines = [f'// Trie data reads per rule match ({len(rule_reads)} rules):']
+
+    for reads in range(min(reads_count, default=0), max(reads_count, default=-1) + 1):
+        count = reads_count.get(reads, 0)
+        bar = '#' * round(40 * count / max_count)
+        lines.append(f'//   {reads:>3} reads: {count:>5} {bar}'.rstrip())
+
+    return lines
 
 
 ###############################################################################
@@ -553,12 +1019,12 @@ def encode_link(link: Dict[str, Any]) -> List[int]:
 
 
 ###############################################################################
-def sequence_len(node: Tuple[str, str]) -> int:
+def sequence_len(node: Tuple[str, str, int]) -> int:
     return len(node[0])
 
 
 ###############################################################################
-def transform_len(node: Tuple[str, str]) -> int:
+def transform_len(node: Tuple[str, str, int]) -> int:
     return len(node[1])
 
 
@@ -573,62 +1039,203 @@ def uint16_to_hex(b: int) -> str:
 
 
 ###############################################################################
-def create_test_rule_c_string(
-    char_map: Dict[str, int],
-    sequence: str,
-    transform: str
-) -> str:
-    """ returns a string with the following format:
-        { "transform", (uint16_t[4]){ 0x1234, 0x1234, 0x1234, 0} },
+def make_test_transform_table() -> Dict[int, str]:
+    """Returns the str.translate table for test header transform strings,
+    since we don't want any utf8 symbols in them.
     """
-    # we don't want any utf8 symbols in transformation string here
-    transform_dict = {
+    return str.maketrans({
         "\\": "\\\\",
         WORDBREAK_CHAR: " ",
         **{sym: char for sym, char in zip(MAGIC_CHARS, SEQ_TOKENS_ASCII)}
-    }
-    for (i, j) in transform_dict.items():
-        transform = transform.replace(i, j)
-    seq_ints = [char_map[c] for c in sequence] + [0]
+    })
+
+
+###############################################################################
+def create_test_rule_c_string(
+    transform_table: Dict[int, str],
+    keycodes: array,
+    transform: str,
+    line_number: int,
+    rule_set: int
+) -> str:
+    """ returns a string with the following format:
+        { "transform", (uint16_t[4]){ 0x1234, 0x1234, 0x1234, 0}, 12, 0 },
+    """
+    transform = transform.translate(transform_table)
+    seq_ints = [*keycodes, 0]
     seq_int_str = ', '.join(map(uint16_to_hex, seq_ints))
-    res = f'    {{ "{transform}", (uint16_t[{len(seq_ints)}]){{ {seq_int_str} }} }},'
+    res = (
+        f'    {{ "{transform}", (uint16_t[{len(seq_ints)}]){{ {seq_int_str} }}, '
+        f'{line_number}, {rule_set} }},'
+    )
     return res
 
 
 ###############################################################################
-def generate_sequence_transform_data(data_header_file, test_header_file):
+def shard_test_rules(test_rules: List[str], shards: int) -> List[List[str]]:
+    """Splits the test rules into round-robin shards, so that rules from
+    every part of the dictionary end up spread evenly across them."""
+    if shards < 1:
+        raise SystemExit(f'{err()} test_shards must be at least 1 ({shards})')
+
+    return [test_rules[i::shards] for i in range(shards)]
+
+
+###############################################################################
+def generate_sequence_transform_data(
+    data_header_file, test_header_file, test_rules_header_file
+):
     char_map = generate_context_char_map(MAGIC_CHARS, WORDBREAK_CHAR)
+    keycode_chars = {code: c for c, code in char_map.items()}
     output_func_char_map = generate_output_func_char_map(OUTPUT_FUNC_CHARS)
 
-    seq_dict = parse_file(RULES_FILE, char_map, SEP_STR, COMMENT_STR)
-    trie = make_trie(seq_dict, output_func_char_map)
-    outputs = complete_trie(trie, WORDBREAK_CHAR)
-    quiet_print(json.dumps(trie, indent=4))
+    rule_sets = []
+    outputs = set()
 
-    s_outputs = serialize_outputs(outputs)
+    for name, rules_file in RULE_SETS.items():
+        # Errors name the rule set, like the tester, when there are several
+        seq_dict, rule_keycodes = parse_file(
+            rules_file, char_map, SEP_STR, COMMENT_STR,
+            name if len(RULE_SETS) > 1 else ''
+        )
+        trie = make_trie(seq_dict, rule_keycodes, output_func_char_map)
+        outputs |= complete_trie(trie, WORDBREAK_CHAR, rule_keycodes, char_map)
+
+        if tracing(TRACE_DUMP):
+            trace_json(TRACE_DUMP, char_keyed_trie(trie, keycode_chars))
+
+        rule_sets.append({
+            'name': name, 'seq_dict': seq_dict,
+            'keycodes': rule_keycodes, 'trie': trie
+        })
+
+    # Rule set names are only shown when there is more than one
+    is_multi_set = len(rule_sets) > 1
+
+    def rule_set_label(rule_set: Dict[str, Any]) -> str:
+        return f'{rule_set["name"]}: ' if is_multi_set else ''
+
+    # All rule sets share one completions buffer
+    bigrams = choose_completion_bigrams(outputs) if COMPRESS_COMPLETIONS else []
+    s_outputs = serialize_outputs(outputs, bigrams)
     completions_data, completions_map, max_completion_len = s_outputs
+    bigrams_data = list(bytes(''.join(bigrams), 'ascii'))
+
+    if bigrams:
+        plain_s_outputs = serialize_outputs(outputs, [])
+        plain_completions_size = len(plain_s_outputs[0])
+        compressed_size = len(completions_data) + len(bigrams_data)
+        trace(TRACE_INFO, lambda: (
+            f'Compressed completions: {len(completions_data)} bytes '
+            f'+ {len(bigrams_data)} bytes of bigrams '
+            f'({plain_completions_size} bytes uncompressed)'
+        ))
 
-    trie_data = serialize_trie(char_map, trie, completions_map)
+        # Small dictionaries may not have enough repetition to pay for the table
+        if compressed_size >= plain_completions_size:
+            completions_data, completions_map, max_completion_len = plain_s_outputs
+            bigrams = bigrams_data = []
+
+    trace(TRACE_INFO, lambda: (
+        f'Completions: {len(completions_data) + len(bigrams_data)} bytes of flash'
+    ))
+
+    # Every rule set gets its own trie, stored one after the other
+    trie_data = []
+    rule_index_data = []
+    rule_reads = []
+    max_lookup_reads, max_lookup_path = 0, ''
+    max_match_reads, max_match_sequence = 0, ''
+    trace_reads = tracing(TRACE_DEBUG)
+
+    for rule_set in rule_sets:
+        set_trie_data, match_entries = serialize_trie(
+            char_map, rule_set['trie'], completions_map
+        )
+        trace(TRACE_INFO, lambda: (
+            f'{rule_set_label(rule_set)}'
+            f'Trie: {len(set_trie_data)} words '
+            f'({len(set_trie_data) * 2} bytes of flash)'
+        ))
+        lookup_worst_case, match_reads = compute_lookup_reads(char_map, set_trie_data)
+
+        if lookup_worst_case[0] > max_lookup_reads:
+            max_lookup_reads = lookup_worst_case[0]
+            max_lookup_path = rule_set_label(rule_set) + lookup_worst_case[1]
+
+        for entry in match_entries:
+            reads = match_reads[entry['uint16_offset']]
+            rule_reads.append(reads)
+
+            if trace_reads:
+                trace(TRACE_DEBUG, lambda: (
+                    f'{rule_set_label(rule_set)}'
+                    f'{entry["match"]["sequence"]}: {reads} reads'
+                ))
+
+            if reads > max_match_reads:
+                max_match_reads = reads
+                max_match_sequence = (
+                    rule_set_label(rule_set) + entry['match']['sequence']
+                )
+
+        rule_set['data_offset'] = len(trie_data)
+        trie_data += set_trie_data
+
+        if RULE_INDEX:
+            set_rule_index_data = serialize_rule_index(
+                generate_ascii_keycode_map(), match_entries, RULE_INDEX_TAIL_LEN
+            )
+            trace(TRACE_INFO, lambda: (
+                f'{rule_set_label(rule_set)}'
+                f'Missed rules index: {len(set_rule_index_data)} words '
+                f'({len(set_rule_index_data) * 2} bytes of flash)'
+            ))
+            rule_set['index_offset'] = len(rule_index_data)
+            rule_index_data += set_rule_index_data
 
     assert all(0 <= b <= 0xffff for b in trie_data)
+    assert all(0 <= b <= 0xffff for b in rule_index_data)
     assert all(0 <= b <= 0xff for b in completions_data)
+    assert all(0 <= b < COMPLETION_BIGRAM_CODE_0 for b in bigrams_data)
+    assert len(trie_data) <= 0xffff and len(rule_index_data) <= 0xffff
 
-    min_sequence = min(seq_dict, key=sequence_len)[0]
-    max_sequence = max(seq_dict, key=sequence_len)[0]
-    max_transform = max(seq_dict, key=transform_len)[1]
+    all_seq_dict = [rule for rule_set in rule_sets for rule in rule_set['seq_dict']]
+    min_sequence = min(all_seq_dict, key=sequence_len)[0]
+    max_sequence = max(all_seq_dict, key=sequence_len)[0]
+    max_transform = max(all_seq_dict, key=transform_len)[1]
 
     # Build the sequence_transform_data.h file.
-    transformations = []
+    tranformations_lines = [
+        f'// Sequence Transformation dictionary with longest match semantics',
+    ]
     test_rules_c_strings = []
+    test_transform_table = make_test_transform_table()
+
+    for rule_set_index, rule_set in enumerate(rule_sets):
+        seq_dict = rule_set['seq_dict']
+        rule_keycodes = rule_set['keycodes']
 
-    for sequence, transformation in seq_dict:
-        # Don't add rules with transformation functions to test header for now
-        if transformation[-1] not in output_func_char_map:
-            test_rule = create_test_rule_c_string(char_map, sequence, transformation)
-            test_rules_c_strings.append(test_rule)
-        transformation = transformation.replace("\\", "\\ [escape]")
-        sequence = f"{sequence:<{len(max_sequence)}}"
-        transformations.append(f'//    {sequence} -> {transformation}')
+        if is_multi_set:
+            tranformations_lines.append(
+                f'// Rule set {rule_set_index} "{rule_set["name"]}" '
+                f'({len(seq_dict)} entries):'
+            )
+
+        else:
+            tranformations_lines.append(f'// Dictionary ({len(seq_dict)} entries):')
+
+        for rule, (sequence, transformation, line_number) in enumerate(seq_dict):
+            # Don't add rules with transformation functions to test header for now
+            if transformation[-1] not in output_func_char_map:
+                test_rule = create_test_rule_c_string(
+                    test_transform_table, rule_keycodes[rule],
+                    transformation, line_number, rule_set_index
+                )
+                test_rules_c_strings.append(test_rule)
+            transformation = transformation.replace("\\", "\\ [escape]")
+            sequence = f"{sequence:<{len(max_sequence)}}"
+            tranformations_lines.append(f'//    {sequence} -> {transformation}')
 
     header_lines = [
         GPL2_HEADER_C_LIKE,
@@ -636,12 +1243,6 @@ def generate_sequence_transform_data(data_header_file, test_header_file):
         '#pragma once',
     ]
 
-    tranformations_lines = [
-        f'// Sequence Transformation dictionary with longest match semantics',
-        f'// Dictionary ({len(seq_dict)} entries):',
-        *transformations,
-    ]
-
     # token symbols stored as utf8 strings
     sym_array_str = ", ".join(map(lambda c: f'"{c}"', MAGIC_CHARS))
     st_seq_tokens = f'static const char *st_seq_tokens[] = {{ {sym_array_str} }};'
@@ -660,9 +1261,32 @@ def generate_sequence_transform_data(data_header_file, test_header_file):
         f'#define TRANSFORM_MAX_LEN {len(max_transform)} // "{max_transform}"',
         f'#define COMPLETION_MAX_LENGTH {max_completion_len}',
         f'#define MAX_BACKSPACES {max_backspaces}',
+        f'#define TRIE_LOOKUP_MAX_READS {max_lookup_reads} // "{max_lookup_path}"',
+        f'#define TRIE_MATCH_MAX_READS {max_match_reads} // "{max_match_sequence}"',
         f'#define DICTIONARY_SIZE {len(trie_data)}',
-        f'#define COMPLETIONS_SIZE {len(completions_data)}',
+        f'#define COMPLETIONS_SIZE {len(completions_data)}' + (
+            f' // {plain_completions_size} bytes uncompressed'
+            if bigrams else ''
+        ),
         f'#define SEQUENCE_TRANSFORM_COUNT {len(MAGIC_CHARS)}',
+        *([
+            '#define SEQUENCE_TRANSFORM_COMPRESSED_COMPLETIONS',
+            f'#define COMPLETION_BIGRAMS_SIZE {len(bigrams_data)}',
+        ] if bigrams else []),
+        *([
+            '#define SEQUENCE_TRANSFORM_RULE_INDEX',
+            f'#define RULE_INDEX_SIZE {len(rule_index_data)} '
+            f'// {len(rule_index_data) * 2} bytes',
+        ] if rule_index_data else []),
+        *([
+            f'#define SEQUENCE_TRANSFORM_RULE_SETS {len(rule_sets)} // ' +
+            ', '.join(f'"{rule_set["name"]}"' for rule_set in rule_sets),
+            # Sizes of the first rule set, active until another is selected
+            f'#define RULE_SET_0_DICTIONARY_SIZE {rule_sets[1]["data_offset"]}',
+        ] if is_multi_set else []),
+        *([
+            f'#define RULE_SET_0_RULE_INDEX_SIZE {rule_sets[1]["index_offset"]}',
+        ] if is_multi_set and rule_index_data else []),
         '',
         st_seq_tokens_ascii,
         st_wordbreak_ascii
@@ -688,12 +1312,61 @@ def generate_sequence_transform_data(data_header_file, test_header_file):
         '};\n',
     ]
 
+    if bigrams:
+        trie_data_lines += [
+            'static const uint8_t '
+            'sequence_transform_completion_bigrams[COMPLETION_BIGRAMS_SIZE] '
+            'PROGMEM = {',
+
+            textwrap.fill(
+                '    %s' % (', '.join(map(byte_to_hex, bigrams_data))),
+                width=100, subsequent_indent='    '
+            ),
+            '};\n',
+        ]
+
+    if rule_index_data:
+        trie_data_lines += [
+            'static const uint16_t '
+            'sequence_transform_rule_index[RULE_INDEX_SIZE] PROGMEM = {',
+
+            textwrap.fill(
+                '    %s' % (', '.join(map(uint16_to_hex, rule_index_data))),
+                width=135, subsequent_indent='    '
+            ),
+            '};\n',
+        ]
+
+    if is_multi_set:
+        data_offsets = [rule_set['data_offset'] for rule_set in rule_sets]
+        trie_data_lines += [
+            '// Start of each rule set\'s trie in sequence_transform_data',
+            'static const uint16_t sequence_transform_rule_set_data_offsets'
+            '[SEQUENCE_TRANSFORM_RULE_SETS + 1] PROGMEM = {',
+
+            '    %s' % (', '.join(map(str, data_offsets + [len(trie_data)]))),
+            '};\n',
+        ]
+
+    if is_multi_set and rule_index_data:
+        index_offsets = [rule_set['index_offset'] for rule_set in rule_sets]
+        trie_data_lines += [
+            '// Start of each rule set\'s index in sequence_transform_rule_index',
+            'static const uint16_t sequence_transform_rule_set_index_offsets'
+            '[SEQUENCE_TRANSFORM_RULE_SETS + 1] PROGMEM = {',
+
+            '    %s' % (', '.join(map(str, index_offsets + [len(rule_index_data)]))),
+            '};\n',
+        ]
+
     # Write data header file
     sequence_transform_data_h_lines = [
         *header_lines,
         '',
         *trie_stats_lines,
         '',
+        *lookup_reads_histogram(rule_reads),
+        '',
         *tranformations_lines,
         '',
         *trie_data_lines,
@@ -711,16 +1384,55 @@ def generate_sequence_transform_data(data_header_file, test_header_file):
         'typedef struct {',
         '   const char * const      transform_str;',
         '   const uint16_t * const  seq_keycodes;',
+        '   const int               rule_line;',
+        '   const int               rule_set;',
         '} st_test_rule_t;',
         '',
-        'static const st_test_rule_t st_test_rules[] = {',
-        *test_rules_c_strings,
-        '    { 0, 0 }',
-        '};'
+        f'#define ST_TEST_RULE_SHARDS {TEST_SHARDS}',
     ]
+
+    if is_multi_set:
+        names_str = ", ".join(f'"{rule_set["name"]}"' for rule_set in rule_sets)
+        sequence_transform_test_h_lines += [
+            '',
+            f'static const char *st_rule_set_names[] = {{ {names_str} }};',
+        ]
+
     with open(test_header_file, "w", encoding="utf-8") as file:
         file.write("\n".join(sequence_transform_test_h_lines))
 
+    # Write test rules header file (only included by the test runner)
+    test_shards = shard_test_rules(test_rules_c_strings, TEST_SHARDS)
+    test_shards_lines = []
+
+    for i, shard in enumerate(test_shards):
+        test_shards_lines += [
+            f'static const st_test_rule_t st_test_rules_{i}[] = {{',
+            *shard,
+            '    { 0, 0, 0, 0 }',
+            '};',
+            '',
+        ]
+
+    shard_names = ", ".join(f'st_test_rules_{i}' for i in range(TEST_SHARDS))
+    sequence_transform_test_rules_h_lines = [
+        *header_lines,
+        '',
+        f'// {len(test_rules_c_strings)} test rules in {TEST_SHARDS} shards',
+        '',
+        *test_shards_lines,
+        'static const st_test_rule_t * const '
+        'st_test_rule_shards[ST_TEST_RULE_SHARDS] = {',
+
+        textwrap.fill(
+            f'    {shard_names}',
+            width=100, subsequent_indent='    '
+        ),
+        '};\n',
+    ]
+    with open(test_rules_header_file, "w", encoding="utf-8") as file:
+        file.write("\n".join(sequence_transform_test_rules_h_lines))
+
 
 ###############################################################################
 if __name__ == '__main__':
@@ -732,12 +1444,17 @@ if __name__ == '__main__':
     )
 
     parser.add_argument("-q", "--quiet", action="store_true")
+    parser.add_argument(
+        "-t", "--trace-level", type=int,
+        help=f"trace level, from {TRACE_OFF} (off) to {TRACE_DUMP} (trie dumps)"
+    )
     cli_args = parser.parse_args()
 
     THIS_FOLDER = Path(__file__).parent
 
     data_header_file = THIS_FOLDER / "../sequence_transform_data.h"
     test_header_file = THIS_FOLDER / "../sequence_transform_test.h"
+    test_rules_header_file = THIS_FOLDER / "../sequence_transform_test_rules.h"
     config_file = THIS_FOLDER / cli_args.config
     config = json.load(open(config_file, 'rt', encoding="utf-8"))
 
@@ -749,13 +1466,49 @@ if __name__ == '__main__':
         WORDBREAK_CHAR = config['wordbreak_char']
         COMMENT_STR = config['comment_str']
         SEP_STR = config['separator_str']
-        RULES_FILE = THIS_FOLDER / "../../" / config['rules_file_name']
+        # Each rule set is compiled into its own trie, selectable at runtime
+        RULE_SETS = {
+            name: THIS_FOLDER / "../../" / rules_file_name
+            for name, rules_file_name in (
+                config.get("rule_sets") or {"": config['rules_file_name']}
+            ).items()
+        }
     except KeyError as e:
         raise KeyError(f"Incorrect config! {e} key is missing.")
 
-    IS_QUIET = config.get("quiet", True)
+    # "quiet": false traces everything, unless trace_level is set
+    TRACE_LEVEL = config.get(
+        "trace_level", TRACE_OFF if config.get("quiet", True) else TRACE_DUMP
+    )
+    PACKED_CHAINS = config.get("packed_chains", False)
+    COMPRESS_COMPLETIONS = config.get("compress_completions", False)
+    RULE_INDEX = config.get("missed_rules_index", False)
+    RULE_INDEX_TAIL_LEN = config.get("missed_rules_index_tail_len", 2)
+    TEST_SHARDS = config.get("test_shards", 1)
+
+    if cli_args.trace_level is not None:
+        TRACE_LEVEL = cli_args.trace_level
 
     if cli_args.quiet:
-        IS_QUIET = True
+        TRACE_LEVEL = TRACE_OFF
+
+    # Traces can get big, so they can be streamed to a file instead of stdout
+    TRACE_FILE = sys.stdout
+    if TRACE_LEVEL > TRACE_OFF and config.get("trace_file"):
+        TRACE_FILE = open(
+            THIS_FOLDER / "../../" / config["trace_file"], "w", encoding="utf-8"
+        )
+
+    if len(RULE_SETS) > 1 and not all(
+        re.fullmatch(r'\w+', name) for name in RULE_SETS
+    ):
+        raise SystemExit(
+            f'{err()} rule_sets names must only use letters, digits and _'
+        )
+
+    generate_sequence_transform_data(
+        data_header_file, test_header_file, test_rules_header_file
+    )
 
-    generate_sequence_transform_data(data_header_file, test_header_file)
+    if TRACE_FILE is not sys.stdout:
+        TRACE_FILE.close()
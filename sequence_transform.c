@@ -76,13 +76,33 @@ static st_key_stack_t trie_stack = {
 
 //////////////////////////////////////////////////////////////////
 // Trie node and completion data
+// With several rule sets, the first one is active until another is selected
 static st_trie_t trie = {
+#ifdef SEQUENCE_TRANSFORM_RULE_SETS
+    RULE_SET_0_DICTIONARY_SIZE,
+#else
     DICTIONARY_SIZE,
+#endif
     sequence_transform_data,
     COMPLETIONS_SIZE,
     sequence_transform_completions_data,
+#ifdef SEQUENCE_TRANSFORM_COMPRESSED_COMPLETIONS
+    sequence_transform_completion_bigrams,
+#else
+    NULL,
+#endif
     COMPLETION_MAX_LENGTH,
     MAX_BACKSPACES,
+#if defined(SEQUENCE_TRANSFORM_RULE_SETS) && defined(SEQUENCE_TRANSFORM_RULE_INDEX)
+    RULE_SET_0_RULE_INDEX_SIZE,
+    sequence_transform_rule_index,
+#elif defined(SEQUENCE_TRANSFORM_RULE_INDEX)
+    RULE_INDEX_SIZE,
+    sequence_transform_rule_index,
+#else
+    0,
+    NULL,
+#endif
     &trie_stack
 };
 
@@ -94,8 +114,46 @@ static st_cursor_t trie_cursor = {
     {0, 255,0, false},
     {0},
     false,
+    0,
+    0,
 };
 
+//////////////////////////////////////////////////////////////////
+// Rule sets
+static uint8_t active_rule_set = 0;
+
+uint8_t sequence_transform_active_rule_set(void) { return active_rule_set; }
+
+/**
+ * @brief Selects which generated rule set's trie is used for transforms
+ *        and missed rule searches. All rule sets share the same
+ *        completions data, so only the trie (and rule index) change.
+ *        The key buffer is reset, since the rule actions recorded in it
+ *        refer to the previously active trie.
+ *
+ * @param rule_set index of the rule set, in the order of the config's rule_sets
+ */
+void sequence_transform_select_rule_set(uint8_t rule_set)
+{
+#ifdef SEQUENCE_TRANSFORM_RULE_SETS
+    if (rule_set >= SEQUENCE_TRANSFORM_RULE_SETS || rule_set == active_rule_set) {
+        return;
+    }
+    const uint16_t data_start = pgm_read_word(&sequence_transform_rule_set_data_offsets[rule_set]);
+    const uint16_t data_end = pgm_read_word(&sequence_transform_rule_set_data_offsets[rule_set + 1]);
+    trie.data = sequence_transform_data + data_start;
+    trie.data_size = data_end - data_start;
+#ifdef SEQUENCE_TRANSFORM_RULE_INDEX
+    const uint16_t index_start = pgm_read_word(&sequence_transform_rule_set_index_offsets[rule_set]);
+    const uint16_t index_end = pgm_read_word(&sequence_transform_rule_set_index_offsets[rule_set + 1]);
+    trie.rule_index = sequence_transform_rule_index + index_start;
+    trie.rule_index_size = index_end - index_start;
+#endif
+    active_rule_set = rule_set;
+    st_key_buffer_reset(&key_buffer);
+#endif
+}
+
 //////////////////////////////////////////////////////////////////
 #ifdef ST_TESTER
 st_trie_t       *st_get_trie(void) { return &trie; }
@@ -23,6 +23,8 @@ bool process_sequence_transform(uint16_t keycode, keyrecord_t *record, uint16_t
 void sequence_transform_on_missed_rule_user(const st_trie_rule_t *rule);
 void post_process_sequence_transform(void);
 uint16_t sequence_transform_past_keycode(int index);
+void sequence_transform_select_rule_set(uint8_t rule_set);
+uint8_t sequence_transform_active_rule_set(void);
 
 #if SEQUENCE_TRANSFORM_IDLE_TIMEOUT > 0
 void sequence_transform_task(void);
@@ -0,0 +1,205 @@
+# Copyright 2024 Guillaume Stordeur <guillaume.stordeur@gmail.com>
+# Copyright 2024 Matt Skalecki <ikcelaks@gmail.com>
+# Copyright 2024 QKekos <q.kekos.q@gmail.com>
+# SPDX-License-Identifier: Apache-2.0
+"""Builds the tester once, then tests every rule shard in parallel.
+
+Set "test_shards" in your sequence_transform_config.json to split the
+generated test rules into that many shards. Each shard is tested by its
+own tester process, and the failures and warnings of all shards are merged
+into one report, ordered by their line in the rules file.
+
+Examples:
+  python3 run_shards.py
+  python3 run_shards.py -j 4 -t 110 QMKPATH=/path/to/qmk_firmware
+"""
+
+import os
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+THIS_FOLDER = Path(__file__).parent
+TEST_HEADER_FILE = THIS_FOLDER / "../sequence_transform_test.h"
+TESTER = THIS_FOLDER / ("tester.exe" if os.name == "nt" else "tester")
+
+ANSI_ESCAPE_RE = re.compile(r'\033\[[0-9;]*m')
+SHARDS_RE = re.compile(r'#define ST_TEST_RULE_SHARDS (\d+)')
+RULE_SET_NAMES_RE = re.compile(r'st_rule_set_names\[\] = \{(.*)\};')
+RULE_LINE_RE = re.compile(r'\((?:(\w+) )?line (\d+)\)$')
+RULES_TESTED_RE = re.compile(r'^Rules tested: (\d+)$')
+TESTS_FAILED_RE = re.compile(r'^(\d+) tests failed!$')
+WARNINGS_RE = re.compile(r'^(\d+) warnings$')
+
+
+###############################################################################
+def build_tester(make_args: List[str]):
+    result = subprocess.run(["make", *make_args], cwd=THIS_FOLDER)
+    if result.returncode:
+        raise SystemExit(result.returncode)
+
+
+###############################################################################
+def read_shard_count() -> int:
+    with open(TEST_HEADER_FILE, "rt", encoding="utf-8") as file:
+        match = SHARDS_RE.search(file.read())
+
+    if not match:
+        raise SystemExit(f'ST_TEST_RULE_SHARDS not found in {TEST_HEADER_FILE}')
+
+    return int(match.group(1))
+
+
+###############################################################################
+def read_rule_set_names() -> List[str]:
+    """Returns the rule set names in config order
+    (empty if the rules were generated as a single set)."""
+    with open(TEST_HEADER_FILE, "rt", encoding="utf-8") as file:
+        match = RULE_SET_NAMES_RE.search(file.read())
+
+    return re.findall(r'"([^"]*)"', match.group(1)) if match else []
+
+
+###############################################################################
+def run_shard(shard: int, tester_args: List[str]) -> Tuple[int, str]:
+    result = subprocess.run(
+        [str(TESTER), "-x", str(shard), *tester_args],
+        cwd=THIS_FOLDER, capture_output=True, encoding="utf-8"
+    )
+    return result.returncode, result.stdout
+
+
+###############################################################################
+def parse_shard_output(
+    output: str
+) -> Tuple[List[Tuple[Tuple[str, int], str]], Optional[Dict[str, int]]]:
+    """Splits the output of one tester process into its rule reports,
+    keyed by rule set and rules file line, and its summary counts."""
+    blocks = []
+    stats = {"rules": 0, "fail": 0, "warns": 0}
+    block_lines = []
+    in_summary = False
+
+    for line in output.splitlines():
+        plain_line = ANSI_ESCAPE_RE.sub('', line)
+
+        if in_summary:
+            for key, regex in (
+                ("rules", RULES_TESTED_RE),
+                ("fail", TESTS_FAILED_RE),
+                ("warns", WARNINGS_RE),
+            ):
+                match = regex.match(plain_line)
+                if match:
+                    stats[key] = int(match.group(1))
+
+        elif plain_line == "--- TEST SUMMARY ---":
+            in_summary = True
+
+        elif plain_line.startswith("[rule]"):
+            block_lines = [line]
+
+        elif block_lines and not plain_line:
+            match = RULE_LINE_RE.search(ANSI_ESCAPE_RE.sub('', block_lines[0]))
+            rule_key = (match.group(1) or '', int(match.group(2))) if match else ('', 0)
+            blocks.append((rule_key, "\n".join(block_lines)))
+            block_lines = []
+
+        elif block_lines:
+            block_lines.append(line)
+
+    if not in_summary:
+        stats = None
+
+    return blocks, stats
+
+
+###############################################################################
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of tester processes to run at once"
+    )
+    parser.add_argument(
+        "-p", action="store_true", help="print all tested rules"
+    )
+    parser.add_argument(
+        "-t", type=str, help="test bit string, as for the tester"
+    )
+    parser.add_argument(
+        "-r", type=int, help="only test the rules of this rule set"
+    )
+    parser.add_argument(
+        "make_args", nargs="*", help="extra arguments passed to make"
+    )
+    cli_args = parser.parse_args()
+
+    build_tester(cli_args.make_args)
+    shards = read_shard_count()
+    rule_set_indexes = {
+        name: index for index, name in enumerate(read_rule_set_names())
+    }
+
+    tester_args = ["-p"] if cli_args.p else []
+    if cli_args.t:
+        tester_args += ["-t", cli_args.t]
+    if cli_args.r is not None:
+        tester_args += ["-r", str(cli_args.r)]
+
+    with ThreadPoolExecutor(max_workers=cli_args.jobs) as executor:
+        results = list(executor.map(
+            lambda shard: run_shard(shard, tester_args), range(shards)
+        ))
+
+    all_blocks = []
+    totals = {"rules": 0, "fail": 0, "warns": 0}
+    crashed = []
+
+    for shard, (returncode, output) in enumerate(results):
+        blocks, stats = parse_shard_output(output)
+        all_blocks += blocks
+
+        if stats is None or returncode < 0:
+            crashed.append(f'shard {shard} (exit code {returncode})')
+            continue
+
+        for key in totals:
+            totals[key] += stats[key]
+
+    # Python's sort is stable, so rules from the same line keep their order.
+    # With several rule sets, reports are grouped by rule set, in config order.
+    def report_order(block: Tuple[Tuple[str, int], str]) -> Tuple[int, int]:
+        (rule_set_name, line), _ = block
+        return rule_set_indexes.get(rule_set_name, 0), line
+
+    for _, block in sorted(all_blocks, key=report_order):
+        print(block)
+        print()
+
+    print("--- TEST SUMMARY ---")
+    print(f'Shards tested: {shards}')
+    print(f'Rules tested: {totals["rules"]}')
+
+    if not totals["fail"]:
+        print("\033[0;32mAll tests passed!\033[0m")
+    else:
+        print(f'\033[0;31m{totals["fail"]} tests failed!\033[0m')
+
+    if totals["warns"]:
+        print(f'\033[0;33m{totals["warns"]} warnings\033[0m')
+
+    if crashed:
+        print(f'\033[0;31mTester did not finish: {", ".join(crashed)}\033[0m')
+
+    sys.exit(1 if totals["fail"] or crashed else 0)
+
+
+###############################################################################
+if __name__ == '__main__':
+    main()
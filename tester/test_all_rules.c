@@ -4,6 +4,7 @@
 #include "sequence_transform.h"
 #include "sequence_transform_data.h"
 #include "sequence_transform_test.h"
+#include "sequence_transform_test_rules.h"
 #include "tester_utils.h"
 #include "tester.h"
 #include "sim_output_buffer.h"
@@ -18,12 +19,13 @@ static const char *test_result_str[] = {
 
 //////////////////////////////////////////////////////////////////
 static st_test_info_t rule_tests[] = {
-    { test_perform,         "st_perform",           { false, {0} } },
-    { test_virtual_output,  "st_virtual_output",    { false, {0} } },
-	{ test_cursor,          "st_cursor",            { false, {0} } },
-    { test_backspace,       "st_handle_backspace",  { false, {0} } },
-    { test_find_rule,       "st_find_missed_rule",  { false, {0} } },
-    { 0,                    0,                      { false, {0} } }
+    { test_perform,         "st_perform",                  { false, {0} } },
+    { test_virtual_output,  "st_virtual_output",           { false, {0} } },
+	{ test_cursor,          "st_cursor",                   { false, {0} } },
+    { test_backspace,       "st_handle_backspace",         { false, {0} } },
+    { test_find_rule,       "st_find_missed_rule",         { false, {0} } },
+    { test_rule_index,      "st_trie_indexed_rule_search", { false, {0} } },
+    { 0,                    0,                             { false, {0} } }
 };
 
 //////////////////////////////////////////////////////////////////////
@@ -39,6 +41,8 @@ int test_rule(const st_test_rule_t *rule,
               bool print_all,
               int *warns)
 {
+    // Rules are tested with the trie of their own rule set
+    sequence_transform_select_rule_set(rule->rule_set);
     // Call all the tests and gather results
     bool all_pass = true;
     bool print = print_all;
@@ -67,7 +71,13 @@ int test_rule(const st_test_rule_t *rule,
     // Print test results
     char seq_str[256] = {0};
     keycodes_to_utf8_str(rule->seq_keycodes, seq_str);
-    printf("[rule] %s ⇒ %s\n", seq_str, rule->transform_str);
+#ifdef SEQUENCE_TRANSFORM_RULE_SETS
+    printf("[rule] %s ⇒ %s (%s line %d)\n", seq_str, rule->transform_str,
+           st_rule_set_names[rule->rule_set], rule->rule_line);
+#else
+    printf("[rule] %s ⇒ %s (line %d)\n",
+           seq_str, rule->transform_str, rule->rule_line);
+#endif
     for (int i = 0; rule_tests[i].func; ++i) {
         if (!tests[i]) {
             continue;
@@ -99,12 +109,22 @@ int test_all_rules(const st_test_options_t *options)
     }
     // Apply tests to each rule
     int rules = 0, pass = 0, warns = 0;
-    for (; st_test_rules[rules].transform_str; ++rules) {
-        pass += test_rule(&st_test_rules[rules],
-                          tests,
-                          options->print_all,
-                          &warns);
-    }    
+    for (int shard = 0; shard < ST_TEST_RULE_SHARDS; ++shard) {
+        if (options->shard >= 0 && options->shard != shard) {
+            continue;
+        }
+        const st_test_rule_t *rule = st_test_rule_shards[shard];
+        for (; rule->transform_str; ++rule) {
+            if (options->rule_set >= 0 && options->rule_set != rule->rule_set) {
+                continue;
+            }
+            ++rules;
+            pass += test_rule(rule,
+                              tests,
+                              options->print_all,
+                              &warns);
+        }
+    }
     // Show tests performed and stats
     printf("--- TEST SUMMARY ---\n");
     printf("Rules tested: %d\n", rules);
@@ -165,3 +165,37 @@ void test_find_rule(const st_test_rule_t *rule, st_test_result_t *res)
         return;
     }
 }
+//////////////////////////////////////////////////////////////////////
+void test_rule_index(const st_test_rule_t *rule, st_test_result_t *res)
+{
+    st_trie_t *trie = st_get_trie();
+    const size_t rule_index_size = trie->rule_index_size;
+    if (!rule_index_size) {
+        // no rule index generated, so only one search to test
+        return;
+    }
+    char chained_transform[256] = {0};
+    char indexed_seq[SEQUENCE_MAX_LENGTH + 1] = {0};
+    char indexed_transform[TRANSFORM_MAX_LEN + 1] = {0};
+    if (!setup_input_from_transform(rule, chained_transform)) {
+        return;
+    }
+    // search with the rule index
+    missed_rule_seq[0] = 0;
+    missed_rule_transform[0] = 0;
+    st_find_missed_rule();
+    strcpy(indexed_seq, missed_rule_seq);
+    strcpy(indexed_transform, missed_rule_transform);
+    // search the same buffer with the full trie walk
+    trie->rule_index_size = 0;
+    missed_rule_seq[0] = 0;
+    missed_rule_transform[0] = 0;
+    st_find_missed_rule();
+    trie->rule_index_size = rule_index_size;
+    if (strcmp(indexed_seq, missed_rule_seq) ||
+        strcmp(indexed_transform, missed_rule_transform)) {
+        RES_FAIL("index found: %s ⇒ %s, full search found: %s ⇒ %s",
+                 indexed_seq, indexed_transform,
+                 missed_rule_seq, missed_rule_transform);
+    }
+}
@@ -9,6 +9,7 @@
 #include "keybuffer.h"
 #include "key_stack.h"
 #include "trie.h"
+#include "sequence_transform.h"
 #include "sequence_transform_data.h"
 #include "sequence_transform_test.h"
 #include "tester.h"
@@ -66,7 +67,7 @@ void tap_code16(uint16_t keycode)
 void print_help(void)
 {
     printf("Sequence Transform Tester usage:\n");
-    printf("tester [-p] [-t <tests>] [-s <test_bit_string>]\n");
+    printf("tester [-p] [-t <tests>] [-s <test_bit_string>] [-x <shard>] [-r <rule_set>]\n");
     puts("");
     printf("By default, all tests will be performed on all compiled rules.\n");
     printf("Only test failures and warnings will be shown.\n");
@@ -80,6 +81,13 @@ void print_help(void)
     printf("  -t each bit in <test_bit_string> turns a test on or off.\n");
     printf("     ex: -t \"101\" would only run tests #1 and #3.\n");
     puts("");
+    printf("  -x only test the rules in test shard #<shard> (0 to %d).\n",
+           ST_TEST_RULE_SHARDS - 1);
+    printf("     Shards are set with test_shards in your config file.\n");
+    puts("");
+    printf("  -r only test the rules of rule set #<rule_set>, and use it for -s.\n");
+    printf("     Rule sets are numbered in the order of rule_sets in your config file.\n");
+    puts("");
     printf("Available tests:\n");
     print_available_tests();
 }
@@ -92,6 +100,10 @@ void init_options(int argc, char **argv, st_test_options_t *options)
     options->user_str = 0;
     // default is to only print errors/warnings
     options->print_all = false;
+    // default is to test the rules of every shard
+    options->shard = -1;
+    // default is to test the rules of every rule set
+    options->rule_set = -1;
     // get options from command line args
     for (int i = 1; i < argc; ++i) {
         if (!strcmp(argv[i], "-p")) {
@@ -101,6 +113,25 @@ void init_options(int argc, char **argv, st_test_options_t *options)
             options->action = ACTION_TEST_ASCII_STRING;
         } else if (!strcmp(argv[i], "-t") && i+1 < argc) {
             options->tests = argv[i+1];
+        } else if (!strcmp(argv[i], "-x") && i+1 < argc) {
+            options->shard = atoi(argv[i+1]);
+            if (options->shard < 0 || options->shard >= ST_TEST_RULE_SHARDS) {
+                printf("Invalid shard %s (must be 0 to %d)\n",
+                       argv[i+1], ST_TEST_RULE_SHARDS - 1);
+                exit(1);
+            }
+        } else if (!strcmp(argv[i], "-r") && i+1 < argc) {
+            options->rule_set = atoi(argv[i+1]);
+#ifdef SEQUENCE_TRANSFORM_RULE_SETS
+            const int rule_sets = SEQUENCE_TRANSFORM_RULE_SETS;
+#else
+            const int rule_sets = 1;
+#endif
+            if (options->rule_set < 0 || options->rule_set >= rule_sets) {
+                printf("Invalid rule set %s (must be 0 to %d)\n",
+                       argv[i+1], rule_sets - 1);
+                exit(1);
+            }
         } else if (!strcmp(argv[i], "-h")) {
             print_help();
             exit(0);
@@ -116,5 +147,8 @@ int main(int argc, char **argv)
 #endif
     st_test_options_t options;
     init_options(argc, argv, &options);
+    if (options.rule_set >= 0) {
+        sequence_transform_select_rule_set(options.rule_set);
+    }
     return actions[options.action](&options);
 }
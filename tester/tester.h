@@ -34,6 +34,8 @@ typedef struct {
     char    *user_str;
     char    *tests;
     bool    print_all;
+    int     shard;
+    int     rule_set;
 } st_test_options_t;
 
 typedef int (*st_test_action_t)(const st_test_options_t *);
@@ -49,6 +51,7 @@ void    test_virtual_output(const st_test_rule_t *rule, st_test_result_t *res);
 void    test_cursor(const st_test_rule_t *rule, st_test_result_t *res);
 void    test_backspace(const st_test_rule_t *rule, st_test_result_t *res);
 void    test_find_rule(const st_test_rule_t *rule, st_test_result_t *res);
+void    test_rule_index(const st_test_rule_t *rule, st_test_result_t *res);
 int     test_rule(const st_test_rule_t *rule, bool *tests, bool print_all, int *warns);
 
 //      Test Actions
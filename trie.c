@@ -20,13 +20,24 @@
 #define TRIE_MATCH_BIT      0x8000
 #define TRIE_BRANCH_BIT     0x4000
 #define TRIE_CODE_MASK      0x3FFF
+// Packed chain words hold 2 keycodes (high byte first),
+// smaller chain words hold a single (wide) keycode
+#define TRIE_PACKED_CHAIN_MIN   0x0400
 
 #ifndef SEQUENCE_TRANSFORM_RULE_SEARCH_MAX_SKIP
 #define SEQUENCE_TRANSFORM_RULE_SEARCH_MAX_SKIP 4
 #endif
 
+// Must match RULE_INDEX_HASH_MULT in the generator script
+#define RULE_INDEX_HASH_MULT 31
+
 #define TDATA(L) pgm_read_word(&trie->data[L])
 #define CDATA(L) pgm_read_byte(&trie->completions[L])
+#define BDATA(L) pgm_read_byte(&trie->completion_bigrams[L])
+
+// Completion bytes from this code up are indexes into the bigram table
+#define COMPLETION_BIGRAM_CODE_0 0x80
+#define RDATA(L) pgm_read_word(&trie->rule_index[L])
 
 //////////////////////////////////////////////////////////////////
 bool st_trie_get_completion(st_cursor_t *cursor, st_trie_search_result_t *res)
@@ -121,14 +132,28 @@ bool st_find_longest_chain(st_cursor_t *cursor, st_trie_match_t *longest_match,
         } else {
             // No high bits set, so this is a chain node
             // Travel down chain until we reach a zero byte, or we no longer match our buffer
-            do {
+            while (true) {
 #ifdef SEQUENCE_TRANSFORM_TRIE_SANITY_CHECKS
                 // TODO: st_debug(ST_LOG_TRIE_SEARCH_BIT, "Chaining Offset: %d; Code: %#04X\n", offset, code);
                 uprintf("Chaining Offset: %d; Code: %#04X\n", offset, code);
 #endif
+                if (code >= TRIE_PACKED_CHAIN_MIN) {
+                    if ((code >> 8) != st_cursor_get_keycode(cursor))
+                        return longer_match_found;
+                    code &= 0xFF;
+                    // A zero low byte ends the chain
+                    if (!code)
+                        break;
+                    if (!st_cursor_next(cursor))
+                        return longer_match_found;
+                }
                 if (code != st_cursor_get_keycode(cursor))
                     return longer_match_found;
-            } while ((code = TDATA(++offset)) && st_cursor_next(cursor));
+                if (!(code = TDATA(++offset)))
+                    break;
+                if (!st_cursor_next(cursor))
+                    return longer_match_found;
+            }
             // After a chain, there should be a match or branch
             ++offset;
         }
@@ -186,6 +211,9 @@ bool st_trie_do_rule_searches(st_trie_t              *trie,
     search.result = rule;
     const int max_skip_levels = st_min(1 + trie->max_backspaces,
                                        SEQUENCE_TRANSFORM_RULE_SEARCH_MAX_SKIP);
+    if (trie->rule_index_size) {
+        return st_trie_indexed_rule_search(&search, search_base_ridx, max_skip_levels);
+    }
     for (int i = search_base_ridx; i < key_buffer->context_len; ++i) {
         // For every base search_base_ridx, increase skip_levels until we find a match.
         // Each skip level allows for a rule trigger key or deleted char.
@@ -201,6 +229,137 @@ bool st_trie_do_rule_searches(st_trie_t              *trie,
     return false;
 }
 //////////////////////////////////////////////////////////////////////
+// Hash of the last `tail_len` keys of the buffer, most recent first.
+// Used to find the rule index bucket of rules whose completion
+// could end the buffer.
+uint16_t st_rule_index_hash(const st_key_buffer_t *key_buffer, int tail_len)
+{
+    uint16_t hash = 0;
+    for (int i = 0; i < tail_len; ++i) {
+        hash = hash * RULE_INDEX_HASH_MULT + st_key_buffer_get_keycode(key_buffer, i);
+    }
+    return hash;
+}
+/**
+ * @brief Same search as st_trie_do_rule_searches, but only inspects
+ *        the rules from the generated rule index whose completion
+ *        tail hashes like the end of the key buffer.
+ *        Index buckets are sorted by descending completion length,
+ *        then ascending backspaces, then descending trie offset.
+ *        The full search keeps the last matching sibling at skipped
+ *        levels and checks children before their parent, so with the
+ *        trie laid out in preorder, the first rule found is the same.
+ *
+ * @param search            search struct with trie, key_buffer and result set
+ * @param search_base_ridx  smallest reverse index the completion may start at
+ * @param max_skip_levels   max number of trigger + backspace keys
+ * @return                  true if match found that reaches end of key_buffer
+ */
+bool st_trie_indexed_rule_search(st_trie_search_t *search,
+                                 int search_base_ridx,
+                                 int max_skip_levels)
+{
+    st_trie_t *trie = search->trie;
+    const st_key_buffer_t *key_buffer = search->key_buffer;
+    const st_key_stack_t *key_stack = trie->key_stack;
+    const uint16_t bucket_mask = RDATA(0);
+    const int tail_len = RDATA(1);
+    const int max_completion_len = key_buffer->context_len - search_base_ridx;
+    // Completions at least tail_len long were hashed on their last tail_len chars,
+    // shorter ones on their whole string, so check longest tails first.
+    for (int len = st_min(tail_len, max_completion_len); len > 0; --len) {
+        const uint16_t bucket = st_rule_index_hash(key_buffer, len) & bucket_mask;
+        const uint16_t bucket_end = RDATA(2 + bucket + 1);
+        for (uint16_t i = RDATA(2 + bucket); i < bucket_end; ++i) {
+            const uint16_t offset = RDATA(i);
+            st_trie_payload_t payload;
+            st_get_payload_from_code(&payload, TDATA(offset), TDATA(offset + 1));
+            if (payload.completion_len < len ||
+                (len < tail_len && payload.completion_len != len) ||
+                payload.completion_len > max_completion_len) {
+                continue;
+            }
+            const int skips = 1 + payload.num_backspaces;
+            if (skips > max_skip_levels) {
+                continue;
+            }
+            const int base_ridx = key_buffer->context_len - payload.completion_len;
+            search->skip_levels = skips;
+            search->search_end_ridx = base_ridx + skips;
+            if (!st_trie_get_match_path(trie, offset) ||
+                key_stack->size <= skips ||
+                key_stack->size > search->search_end_ridx) {
+                continue;
+            }
+            if (st_check_rule_match(&payload, search)) {
+                return true;
+            }
+        }
+    }
+    return false;
+}
+//////////////////////////////////////////////////////////////////////
+// Fills the trie key stack with the keys on the path from the root
+// to the match node at match_offset.
+// Nodes are serialized depth first, so every child's subtree is stored
+// contiguously, and the path always follows the last child
+// whose offset doesn't exceed match_offset.
+bool st_trie_get_match_path(st_trie_t *trie, uint16_t match_offset)
+{
+    st_key_stack_t *key_stack = trie->key_stack;
+    uint16_t offset = 0;
+    key_stack->size = 0;
+    while (offset <= match_offset) {
+        uint16_t code = TDATA(offset);
+        // Match Node if bit 15 is set
+        if (code & TRIE_MATCH_BIT) {
+            if (offset == match_offset) {
+                return true;
+            }
+            // If bit 14 is not set, there are no child nodes to follow
+            if (!(code & TRIE_BRANCH_BIT)) {
+                return false;
+            }
+            offset += 2;
+            code = TDATA(offset);
+        }
+        // BRANCH node if bit 14 is set
+        if (code & TRIE_BRANCH_BIT) {
+            uint16_t child_key = 0;
+            uint16_t child_offset = 0;
+            for (code &= TRIE_CODE_MASK; code; offset += 2, code = TDATA(offset)) {
+                const uint16_t next_offset = TDATA(offset + 1);
+                if (next_offset > match_offset) {
+                    break;
+                }
+                child_key = code;
+                child_offset = next_offset;
+            }
+            if (!child_key) {
+                return false;
+            }
+            st_key_stack_push(key_stack, child_key);
+            offset = child_offset;
+        } else {
+            // Chain node: push every key until the zero code
+            for (; code; code = TDATA(++offset)) {
+                if (code >= TRIE_PACKED_CHAIN_MIN) {
+                    st_key_stack_push(key_stack, code >> 8);
+                    // A zero low byte ends the chain
+                    if (!(code & 0xFF)) {
+                        break;
+                    }
+                    code &= 0xFF;
+                }
+                st_key_stack_push(key_stack, code);
+            }
+            // After a chain, there should be a match or branch
+            ++offset;
+        }
+    }
+    return false;
+}
+//////////////////////////////////////////////////////////////////////
 // Utility function to print debug info about a potential rule match,
 // done here so we don't make a mess in st_check_rule_match and
 // read stack/completion strings before we actually need to.
@@ -222,11 +381,29 @@ void debug_rule_match(const st_trie_payload_t *payload,
             offset, transform_end_ridx, stackstr, compstr, backspaces);
 }
 //////////////////////////////////////////////////////////////////////
+// Simulate future buffer keys by offsetting buffer access
+#define OFFSET_BUFFER_VAL st_key_buffer_get_keycode(key_buffer, key_stack->size - search->search_end_ridx)
+//////////////////////////////////////////////////////////////////////
+// Pushes a chain key to the stack if it can still match the search buffer
+bool rule_search_push_chain_key(st_trie_search_t *search, uint16_t key)
+{
+    const st_key_buffer_t *key_buffer = search->key_buffer;
+    st_key_stack_t *key_stack = search->trie->key_stack;
+    if (key_stack->size >= search->search_end_ridx) {
+        return false;
+    }
+    const bool check = key_stack->size >= search->skip_levels;
+    const uint16_t cur_key = check ? OFFSET_BUFFER_VAL : 0;
+    if (check && cur_key != key) {
+        return false;
+    }
+    st_key_stack_push(key_stack, key);
+    return true;
+}
+//////////////////////////////////////////////////////////////////////
 // Recursive trie search function used by st_trie_do_rule_searches
 bool st_trie_rule_search(st_trie_search_t *search, uint16_t offset)
 {
-// Simulate future buffer keys by offsetting buffer access
-#define OFFSET_BUFFER_VAL st_key_buffer_get_keycode(key_buffer, key_stack->size - search->search_end_ridx)
     st_trie_t *trie = search->trie;
     const st_key_buffer_t *key_buffer = search->key_buffer;
     st_key_stack_t *key_stack = trie->key_stack;
@@ -281,23 +458,30 @@ bool st_trie_rule_search(st_trie_search_t *search, uint16_t offset)
     // Travel down chain until we reach a zero code, or we no longer match our buffer
     const int prev_stack_size = key_stack->size;
     for (; code; code = TDATA(++offset)) {
-        if (key_stack->size >= search->search_end_ridx) {
-            key_stack->size = prev_stack_size;
-            return false;
+        if (code >= TRIE_PACKED_CHAIN_MIN) {
+            const uint16_t low_key = code & 0xFF;
+            if (!rule_search_push_chain_key(search, code >> 8) ||
+                (low_key && !rule_search_push_chain_key(search, low_key))) {
+                key_stack->size = prev_stack_size;
+                return false;
+            }
+            // A zero low byte ends the chain
+            if (!low_key) {
+                break;
+            }
+            continue;
         }
-        const bool check = key_stack->size >= search->skip_levels;
-        const uint16_t cur_key = check ? OFFSET_BUFFER_VAL : 0;
-        if (check && cur_key != code) {
+        if (!rule_search_push_chain_key(search, code)) {
             key_stack->size = prev_stack_size;
             return false;
         }
-        st_key_stack_push(key_stack, code);
     }
     // After a chain, there should be a leaf or branch
     const bool res = st_trie_rule_search(search, offset+1);
     key_stack->size = prev_stack_size;
     return res;
 }
+
 //////////////////////////////////////////////////////////////////////
 bool stack_contains_unexpanded_seq(const st_key_stack_t *s)
 {
@@ -342,9 +526,11 @@ bool st_check_rule_match(const st_trie_payload_t *payload, st_trie_search_t *sea
     }
     // Check if completed string matches what comes next in our search buffer
     //printf("  testing completion: ");
-    const int completion_end = payload->completion_index + payload->completion_len;
-    for (int i = payload->completion_index, j = search_base_ridx; i < completion_end; ++i, ++j) {
-        const char ascii_code = CDATA(i);
+    st_completion_reader_t reader;
+    st_completion_reader_init(&reader, trie, payload->completion_index);
+    const int transform_end = search_base_ridx + payload->completion_len;
+    for (int j = search_base_ridx; j < transform_end; ++j) {
+        const char ascii_code = st_completion_reader_next(&reader);
         const uint16_t comp_key = st_char_to_keycode(ascii_code);
         const uint16_t buf_key = st_key_buffer_get_keycode(key_buffer, -(j+1));
         //printf("[%02X(%c), %02X(%c)] ", comp_key, ascii_code,
@@ -379,9 +565,76 @@ void st_completion_to_str(const st_trie_t *trie,
                           const st_trie_payload_t *payload,
                           char *str)
 {
-    const uint16_t completion_end = payload->completion_index + payload->completion_len;
-    for (uint16_t i = payload->completion_index; i < completion_end; ++i) {
-        *str++ = CDATA(i);
+    st_completion_reader_t reader;
+    st_completion_reader_init(&reader, trie, payload->completion_index);
+    for (int i = 0; i < payload->completion_len; ++i) {
+        *str++ = st_completion_reader_next(&reader);
     }
     *str = '\0';
 }
+//////////////////////////////////////////////////////////////////////
+void st_completion_reader_init(st_completion_reader_t *reader,
+                               const st_trie_t *trie,
+                               uint16_t completion_index)
+{
+    reader->trie = trie;
+    reader->index = completion_index;
+    reader->pending = 0;
+}
+//////////////////////////////////////////////////////////////////////
+// Returns the next char of a completion string.
+// Bytes >= COMPLETION_BIGRAM_CODE_0 are decoded into the
+// two chars at their index in the bigram table.
+char st_completion_reader_next(st_completion_reader_t *reader)
+{
+    const st_trie_t *trie = reader->trie;
+    if (reader->pending) {
+        const char c = reader->pending;
+        reader->pending = 0;
+        return c;
+    }
+    const uint8_t code = CDATA(reader->index++);
+    if (code < COMPLETION_BIGRAM_CODE_0) {
+        return code;
+    }
+    const uint16_t bigram_index = (code - COMPLETION_BIGRAM_CODE_0) * 2;
+    reader->pending = BDATA(bigram_index + 1);
+    return BDATA(bigram_index);
+}
+//////////////////////////////////////////////////////////////////////
+// Returns the char at char_index in a completion string,
+// scanning from a known code instead of the start of the completion.
+// code_index is the completions buffer index of that code and
+// code_char_index the index of its first char in the completion.
+// Both are updated to the code holding char_index, so that nearby
+// chars (in either direction) can be looked up without a rescan.
+char st_completion_char_from(const st_trie_t *trie,
+                             uint16_t *code_index,
+                             uint8_t *code_char_index,
+                             int char_index)
+{
+    if (!trie->completion_bigrams) {
+        return CDATA(*code_index + char_index - *code_char_index);
+    }
+    uint16_t i = *code_index;
+    int first_char = *code_char_index;
+    // Every code decodes on its own, so we can also scan backwards
+    while (char_index < first_char) {
+        first_char -= CDATA(--i) < COMPLETION_BIGRAM_CODE_0 ? 1 : 2;
+    }
+    uint8_t code = CDATA(i);
+    for (;;) {
+        const int code_len = code < COMPLETION_BIGRAM_CODE_0 ? 1 : 2;
+        if (char_index < first_char + code_len) {
+            break;
+        }
+        first_char += code_len;
+        code = CDATA(++i);
+    }
+    *code_index = i;
+    *code_char_index = first_char;
+    if (code < COMPLETION_BIGRAM_CODE_0) {
+        return code;
+    }
+    return BDATA((code - COMPLETION_BIGRAM_CODE_0) * 2 + char_index - first_char);
+}
@@ -33,8 +33,11 @@ typedef struct
     const uint16_t  *data;              // serialized trie node data
     size_t          completions_size;   // size in bytes of completions data buffer
     const uint8_t   *completions;       // packed completions strings buffer
+    const uint8_t   *completion_bigrams;// char pairs for completion codes >= 0x80 (NULL if uncompressed)
     uint8_t         completion_max_len; // max len of all completion strings
     uint8_t         max_backspaces;     // max backspaces for all completions
+    size_t          rule_index_size;    // size in words of rule index buffer (0 if not generated)
+    const uint16_t  *rule_index;        // hashed index of match nodes used by missed rule searches
     st_key_stack_t * const  key_stack;  // key stack used for searches
 } st_trie_t;
 
@@ -45,6 +48,8 @@ typedef struct
     st_cursor_pos_t               cursor_pos;       // Contains all position info for the cursor
     st_trie_payload_t             cached_action;
     uint8_t                       cache_valid;
+    uint16_t                      cached_code_index;  // completions buffer index of the code last read
+    uint8_t                       cached_code_char;   // completion char index of that code's first char
 } st_cursor_t;
 
 typedef struct
@@ -81,9 +86,22 @@ typedef struct
     st_trie_rule_t          *result;                // pointer to result to be filled with best match
 } st_trie_search_t;
 
+typedef struct
+{
+    const st_trie_t *trie;                  // trie containing the completions
+    uint16_t        index;                  // index of next byte to read from completions buffer
+    char            pending;                // second char of a bigram to return next (0 if none)
+} st_completion_reader_t;
+
 void st_get_payload_from_match_index(const st_trie_t *trie, st_trie_payload_t *payload, uint16_t trie_match_index);
 void st_get_payload_from_code(st_trie_payload_t *payload, uint16_t code, uint16_t completion_index);
 bool st_trie_rule_search(st_trie_search_t *search, uint16_t offset);
+bool st_trie_indexed_rule_search(st_trie_search_t *search, int search_base_ridx, int max_skip_levels);
+bool st_trie_get_match_path(st_trie_t *trie, uint16_t match_offset);
+uint16_t st_rule_index_hash(const st_key_buffer_t *key_buffer, int tail_len);
 bool st_find_longest_chain(st_cursor_t *cursor, st_trie_match_t *longest_match, uint16_t offset);
 void st_completion_to_str(const st_trie_t *trie, const st_trie_payload_t *payload, char *str);
+void st_completion_reader_init(st_completion_reader_t *reader, const st_trie_t *trie, uint16_t completion_index);
+char st_completion_reader_next(st_completion_reader_t *reader);
+char st_completion_char_from(const st_trie_t *trie, uint16_t *code_index, uint8_t *code_char_index, int char_index);
 bool st_check_rule_match(const st_trie_payload_t *payload, st_trie_search_t *search);